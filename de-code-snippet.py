@@ -4,12 +4,14 @@
 import sqlite3
 import pandas as pd
 import numpy as np
-import json
 import logging
 from datetime import datetime, timedelta
-import random
 import os
 import matplotlib.pyplot as plt
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from numba import njit, prange
+from adbc_driver_sqlite import dbapi as sqlite_adbc
 
 # Logging configuration
 logging.basicConfig(
@@ -20,9 +22,39 @@ logger = logging.getLogger('supercourier_mini_etl')
 
 # Constants
 DB_PATH = 'supercourier_mini.db'
-WEATHER_PATH = 'weather_data.json'
+WEATHER_PATH = 'weather_data.parquet'
 OUTPUT_PATH = 'deliveries.csv'
 
+# Single RNG shared by all bulk draws (PCG64, reproducible runs)
+RNG = np.random.default_rng(seed=42)
+
+# Delivery time coefficients
+COEFFS_PACKAGE_TYPE = {
+    'Small': 1.0,
+    'Medium': 1.2,
+    'Large': 1.5,
+    'X-Large': 2.0,
+    'Special': 2.5
+}
+
+COEFFS_ZONE = {
+    'Urban': 1.2,
+    'Suburban': 1.0,
+    'Rural': 1.3,
+    'Industrial': 0.9,
+    'Shopping Center': 1.4
+}
+
+COEFFS_WEATHER = {
+    'Sunny': 1.0,
+    'Cloudy': 1.05,
+    'Rainy': 1.2,
+    'Windy': 1.1,
+    'Snowy': 1.8,
+    'Foggy': 1.3,
+    'Unknown': 1.0
+}
+
 # 1. FUNCTION TO GENERATE SQLITE DATABASE (you can modify as needed)
 def create_sqlite_database():
     """
@@ -37,7 +69,13 @@ def create_sqlite_database():
     # Connect to database
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
-    
+
+    # Bulk-load tuning : WAL journal, relaxed fsync, in-memory temp store
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=OFF')
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.execute('PRAGMA cache_size=-65536')
+
     # Create deliveries table
     cursor.execute('''
     CREATE TABLE deliveries (
@@ -53,43 +91,34 @@ def create_sqlite_database():
     package_types = ['Small', 'Medium', 'Large', 'X-Large', 'Special']
     delivery_zones = ['Urban', 'Suburban', 'Rural', 'Industrial', 'Shopping Center']
     
-    # Generate 1000 random deliveries
-    deliveries = []
-    
+    # Generate 1000 random deliveries in bulk
+    n = 1000
+
     end_date = datetime.now()
     start_date = end_date - timedelta(days=90)  # 3 months
+
+    # Random dates within last 3 months, formatted in one pass
+    seconds = RNG.integers(0, int((end_date - start_date).total_seconds()), n)
+    timestamps = pd.to_datetime(start_date) + pd.to_timedelta(seconds, 's')
+    timestamps_str = timestamps.strftime('%Y-%m-%d %H:%M:%S')
+
+    # Random selection of package types and zones
+    package_type = RNG.choice(package_types, size=n,
+                              p=[0.25, 0.30, 0.20, 0.15, 0.10])  # Relative probabilities
+    delivery_zone = RNG.choice(delivery_zones, size=n)
+    recipient_id = RNG.integers(1, 101, n)  # fictional recipient_id
+
+    # .tolist() converts numpy scalars to types sqlite3 can bind
+    deliveries = list(zip(range(1, n + 1), timestamps_str, package_type.tolist(),
+                          delivery_zone.tolist(), recipient_id.tolist()))
     
-    for i in range(1, 1001):
-        # Random date within last 3 months
-        timestamp = start_date + timedelta(
-            seconds=random.randint(0, int((end_date - start_date).total_seconds()))
+    # Insert data in a single transaction (implicit BEGIN/COMMIT)
+    with conn:
+        cursor.executemany(
+            'INSERT INTO deliveries VALUES (?, ?, ?, ?, ?)',
+            deliveries
         )
-        
-        # Random selection of package type and zone
-        package_type = random.choices(
-            package_types, 
-            weights=[25, 30, 20, 15, 10]  # Relative probabilities
-        )[0]
-        
-        delivery_zone = random.choice(delivery_zones)
-        
-        # Add to list
-        deliveries.append((
-            i,  # delivery_id
-            timestamp.strftime('%Y-%m-%d %H:%M:%S'),  # pickup_datetime
-            package_type,
-            delivery_zone,
-            random.randint(1, 100)  # fictional recipient_id
-        ))
-    
-    # Insert data
-    cursor.executemany(
-        'INSERT INTO deliveries VALUES (?, ?, ?, ?, ?)',
-        deliveries
-    )
-    
-    # Commit and close
-    conn.commit()
+
     conn.close()
     
     logger.info(f"Database created with {len(deliveries)} deliveries")
@@ -104,63 +133,65 @@ def generate_weather_data():
     
     conditions = ['Sunny', 'Cloudy', 'Rainy', 'Windy', 'Snowy', 'Foggy']
     weights = [30, 25, 20, 15, 5, 5]  # Relative probabilities
-    
+
     end_date = datetime.now()
     start_date = end_date - timedelta(days=90)
-    
-    weather_data = {}
-    
-    current_date = start_date
-    while current_date <= end_date:
-        date_str = current_date.strftime('%Y-%m-%d')
-        weather_data[date_str] = {}
-        
-        # For each day, generate weather for each hour
-        for hour in range(24):
-            # More continuity in conditions
-            if hour > 0 and random.random() < 0.7:
-                # 70% chance of keeping same condition as previous hour
-                condition = weather_data[date_str].get(str(hour-1), 
-                                                      random.choices(conditions, weights=weights)[0])
-            else:
-                condition = random.choices(conditions, weights=weights)[0]
-            
-            weather_data[date_str][str(hour)] = condition
-        
-        current_date += timedelta(days=1)
-    
-    # Save as JSON
-    with open(WEATHER_PATH, 'w', encoding='utf-8') as f:
-        json.dump(weather_data, f, ensure_ascii=False, indent=2)
-    
+    dates = pd.date_range(start_date.date(), end_date.date(), freq='D')
+    n_days = len(dates)
+
+    # Draw all (day, hour) condition codes at once
+    probs = np.array(weights) / sum(weights)
+    codes = RNG.choice(len(conditions), size=(n_days, 24), p=probs)
+
+    # More continuity in conditions :
+    # 70% chance of keeping same condition as previous hour
+    keep = RNG.random((n_days, 24)) < 0.7
+    for hour in range(1, 24):
+        codes[:, hour] = np.where(keep[:, hour], codes[:, hour - 1], codes[:, hour])
+
+    # Flatten to a columnar frame and save as Parquet
+    # Keep the date key as native datetime64 (no string allocation)
+    weather_df = pd.DataFrame({
+        'date': dates.repeat(24),
+        'hour': np.tile(np.arange(24, dtype='int8'), n_days),
+        'condition': pd.Categorical.from_codes(codes.ravel(), categories=conditions)
+    })
+    weather_df.to_parquet(WEATHER_PATH, compression='zstd')
+
     logger.info(f"Weather data generated for period {start_date.strftime('%Y-%m-%d')} - {end_date.strftime('%Y-%m-%d')}")
-    return weather_data
+    return weather_df
 
 # 3. EXTRACTION FUNCTIONS (to be completed)
 def extract_sqlite_data():
     """
     Extracts delivery data from SQLite database
+    via an Arrow table (no per-cell Python boxing)
     """
     logger.info("Extracting data from SQLite database...")
-    
-    conn = sqlite3.connect(DB_PATH)
-    query = "SELECT * FROM deliveries"
-    df = pd.read_sql(query, conn)
-    conn.close()
-    
+
+    # Project only the columns the pipeline uses (recipient_id is never read)
+    query = "SELECT delivery_id, pickup_datetime, package_type, delivery_zone FROM deliveries"
+    with sqlite_adbc.connect(DB_PATH) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(query)
+            df = cursor.fetch_arrow_table().to_pandas()
+
+    # Low-cardinality string columns are cheaper as categories
+    for col in ('package_type', 'delivery_zone'):
+        df[col] = df[col].astype('category')
+
     logger.info(f"Extraction complete: {len(df)} records")
     return df
 
 def load_weather_data():
     """
-    Loads weather data from JSON file
+    Loads weather data from Parquet file
     """
     logger.info("Loading weather data...")
-    
-    with open(WEATHER_PATH, 'r', encoding='utf-8') as f:
-        weather_data = json.load(f)
-    
-    logger.info(f"Weather data loaded for {len(weather_data)} days")
+
+    weather_data = pd.read_parquet(WEATHER_PATH)
+
+    logger.info(f"Weather data loaded for {weather_data['date'].nunique()} days")
     return weather_data
 
 # 4. TRANSFORMATION FUNCTIONS (to be completed by participants)
@@ -169,94 +200,113 @@ def load_weather_data():
 def enrich_with_weather(df, weather_data):
     """
     Enriches the DataFrame with weather conditions
-    
+    and the datetime-derived features (Hour, Weekday)
     """
     logger.info("Enriching with weather data...")
-    
-    # Convert date column to datetime
-    df['pickup_datetime'] = pd.to_datetime(df['pickup_datetime'], errors='coerce')
-    
-    # Function to get weather for a given timestamp
-    def get_weather(timestamp):
-        date_str = timestamp.strftime('%Y-%m-%d')
-        hour_str = str(timestamp.hour)
-        
-        try:
-            return weather_data[date_str][hour_str]
-        except KeyError:
-            return None
-    
-    # Apply function to each row
-    df['WeatherCondition'] = df['pickup_datetime'].apply(get_weather)
+
+    # Convert date column to datetime once ;
+    # the explicit format keeps the fast C parser, cache=True reuses duplicates
+    dt = pd.to_datetime(df['pickup_datetime'], format='%Y-%m-%d %H:%M:%S',
+                        cache=True, errors='coerce')
+    df['pickup_datetime'] = dt
+
+    # Derive the time features from the single parse ;
+    # Hour stays a native int8 (the CSV writer formats it fine)
+    hours = dt.dt.hour
+    df['Hour'] = hours.astype('int8')
+    df['Weekday'] = pd.Categorical(
+        dt.dt.day_name(),
+        categories=['Monday', 'Tuesday', 'Wednesday', 'Thursday',
+                    'Friday', 'Saturday', 'Sunday']
+    )
+    # Integer day code (0=Monday .. 6=Sunday) for the delivery-time kernel ;
+    # the readable Weekday column above is only kept for the final CSV
+    df['_weekday_code'] = dt.dt.dayofweek.astype('int8')
+
+    # Index the weather frame by (date, hour) once
+    weather_lookup = weather_data.set_index(['date', 'hour'])['condition']
+
+    # Resolve all rows in one indexed lookup (missing keys become NaN) ;
+    # typed keys (datetime64 + int8) avoid allocating 2N key strings
+    date_key = dt.dt.normalize()
+    hour_key = hours.astype('int8')
+    keys = pd.MultiIndex.from_arrays([date_key, hour_key])
+    df['WeatherCondition'] = pd.Categorical(weather_lookup.reindex(keys),
+                                            categories=list(COEFFS_WEATHER))
+    # Pre-fill missing lookups with the explicit 'Unknown' category,
+    # so downstream consumers need no defensive fallback
+    df['WeatherCondition'] = df['WeatherCondition'].fillna('Unknown')
 
     return df
 
-#Function to calculate theoretical ajusted delivery time
-def calculate_ajusted_theoretical_time(row):
+# JIT-compiled inner kernel : theoretical time, random variation,
+# MM.SS formatting and delay check in one parallel loop over raw arrays
+@njit(parallel=True, fastmath=True, cache=True)
+def _delivery_time_kernel(distance, package_code, zone_code, hour, weekday_code,
+                          weather_code, noise, package_coef, zone_coef, weather_coef):
+    n = distance.shape[0]
+    actual_time = np.empty(n)
+    status_code = np.empty(n, dtype=np.int8)
+
+    for i in prange(n):
+        # base_theorical_time : 30 + distance * 0.8 minutes
+        theo = ((30.0 + distance[i] * 0.8)
+                * package_coef[package_code[i]]
+                * zone_coef[zone_code[i]]
+                * weather_coef[weather_code[i]])
+
+        # Time of day factor
+        if 1 <= hour[i] < 12:  # Morning peak
+            theo *= 1.3
+        elif hour[i] >= 12:  # Evening peak
+            theo *= 1.4
+
+        # Day of week factor (0..4 = working day)
+        theo *= 1.2 if weekday_code[i] < 5 else 0.9
+
+        # Random variation, floor at 10 minutes, round to 1 decimal
+        raw = theo * (1.0 + 0.15 * noise[i])
+        if raw < 10.0:
+            raw = 10.0
+        raw = np.rint(raw * 10.0) / 10.0
+
+        # Format as MM.SS
+        total_seconds = np.rint(raw * 60.0)
+        actual_time[i] = total_seconds // 60.0 + (total_seconds % 60.0) / 100.0
+
+        # 1 = Delayed, 0 = On-time
+        status_code[i] = 1 if actual_time[i] > theo * 1.2 else 0
+
+    return actual_time, status_code
+
+
+#Function to calculate actual delivery time and status
+def calculate_delivery_times(df, rng):
     """
-    Calculates the theoretical delivery time before random variation
+    Calculates actual delivery times and status codes for the whole DataFrame
+    Encodes string columns as small integer codes and runs the JIT kernel
+    Returns (actual_time, status_code) arrays
     """
-    # Initaliaze coeffs
-    coeffs_package_type = {
-        'Small': 1.0,
-        'Medium': 1.2,
-        'Large': 1.5,
-        'X-Large': 2.0,
-        'Special': 2.5
-    }
-
-    coeffs_zone = {
-        'Urban': 1.2,
-        'Suburban': 1.0,
-        'Rural': 1.3,
-        'Industrial': 0.9,
-        'Shopping Center': 1.4
-    }
-
-    coeffs_weather = {
-        'Sunny': 1.0,
-        'Cloudy': 1.05,
-        'Rainy': 1.2,
-        'Windy': 1.1,
-        'Snowy': 1.8,
-        'Foggy': 1.3,
-        'Unknown': 1.0
-    }
-    # base_theorical_time : 30 + distance * 0.8 minutes (*60 secondes)
-    base_theorical_time = 30 + row['Distance'] * 0.8
-        
-    # Apply package factor
-    adjusted_theorical_time = base_theorical_time * coeffs_package_type[row['Package_Type']]
-        
-        
-    adjusted_theorical_time = adjusted_theorical_time * coeffs_zone[row['Delivery_Zone']]
-        
-    # Apply time of day factor
-    hour = int(row['Hour'])
-    if 1 <= hour < 12:  # Morning peak
-        adjusted_theorical_time *= 1.3
-    elif 12 <= hour <= 23:  # Evening peak
-        adjusted_theorical_time *= 1.4
-        
-    # Apply day of week factor
-    weekday = row['Weekday']
-    if weekday in ['Monday', 'Tuesday', 'Wednesday', 'Thursday','Friday']:
-        adjusted_theorical_time *= 1.2
-    elif weekday in ['Saturday', 'Sunday']:
-        adjusted_theorical_time *= 0.9
-
-    # Apply weather factor
-    weather_factor = coeffs_weather.get(row.get('Weather_Condition', 'Unknown'), 1.0)
-    adjusted_theorical_time *= weather_factor
-
-    return adjusted_theorical_time
-
-
-def format_time(time_in_minutes):
-    total_seconds = round(time_in_minutes * 60)
-    minutes = total_seconds // 60  # Division entière
-    seconds = total_seconds % 60   # Reste de la division
-    return float(f"{minutes:02d}.{seconds:02d}")
+    package_code = pd.Categorical(df['Package_Type'],
+                                  categories=list(COEFFS_PACKAGE_TYPE)).codes
+    zone_code = pd.Categorical(df['Delivery_Zone'],
+                               categories=list(COEFFS_ZONE)).codes
+    # Weather_Condition is already categorical over list(COEFFS_WEATHER)
+    # with no NaN, so its codes index the coefficient array directly
+    weather_code = df['Weather_Condition'].cat.codes.to_numpy()
+
+    return _delivery_time_kernel(
+        df['Distance'].to_numpy(),
+        package_code,
+        zone_code,
+        df['Hour'].to_numpy(),
+        df['_weekday_code'].to_numpy(),
+        weather_code,
+        rng.standard_normal(len(df)),
+        np.array(list(COEFFS_PACKAGE_TYPE.values())),
+        np.array(list(COEFFS_ZONE.values())),
+        np.array(list(COEFFS_WEATHER.values()))
+    )
 
 def transform_data(df_deliveries, weather_data):
     """
@@ -272,10 +322,6 @@ def transform_data(df_deliveries, weather_data):
     # 1 Enrich with weather data
     df_deliveries = enrich_with_weather(df_deliveries, weather_data)
 
-    #Create new features
-    df_deliveries['Hour'] = df_deliveries['pickup_datetime'].dt.hour.astype(str)
-    df_deliveries['Weekday'] = df_deliveries['pickup_datetime'].dt.day_name()
-    
     #Change feature names
     df_deliveries = df_deliveries.rename(columns={'delivery_id': 'Delivery_ID',
                             'pickup_datetime' : 'Pickup_DateTime',
@@ -284,46 +330,25 @@ def transform_data(df_deliveries, weather_data):
                             'WeatherCondition' : 'Weather_Condition'
                               })
 
-    #Delete 
-    df_deliveries = df_deliveries.drop(['recipient_id'], axis=1)
-    
     #Add distance feature
-    df_deliveries['Distance'] = np.random.uniform(5,100, size=len(df_deliveries))
-    df_deliveries['Distance'] = df_deliveries['Distance'].round(2)
-
-    # 2. Calculate "ajusted theoritical delivery time"
-    logger.info("Calculate ajusted theorical delivery time...")
-    df_deliveries['ajusted_theoretical_time'] = df_deliveries.apply(calculate_ajusted_theoretical_time, axis=1)
+    df_deliveries['Distance'] = RNG.uniform(5, 100, size=len(df_deliveries)).round(2)
 
-    # 3. Calculate Delay threshold
-    logger.info("Calculate delay threshold...")
-    df_deliveries['Delay_threshold'] = df_deliveries['ajusted_theoretical_time'] * 1.2
-
-    # 4. Calculate actual delivery time (with random variation)
-    logger.info("Calculate actual delivery time...")
-    df_deliveries['Actual_Delivery_Time'] = df_deliveries['ajusted_theoretical_time'].apply(
-        lambda x: round(max(10, np.random.normal(x, x * 0.15)), 1)
-    )
+    # 2. Calculate delivery times and Status in one fused JIT pass:
+    # theoretical time, random variation, time formatting and delay check
+    logger.info("Calculate delivery times and status...")
+    actual_time, status_code = calculate_delivery_times(df_deliveries, RNG)
 
-    # Transform df_deliveries['Actual_Delivery_Time'] to minutes :
-    df_deliveries['Actual_Delivery_Time'] = df_deliveries['Actual_Delivery_Time']
-
-    # Transform time
-    df_deliveries['Actual_Delivery_Time'] = df_deliveries['Actual_Delivery_Time'].apply(format_time)
-
-    # 5. Determine Status
-    logger.info("Determine the status of the delivery...")
-    df_deliveries['Status'] = df_deliveries.apply(
-        lambda row: 'Delayed' if row['Actual_Delivery_Time'] > row['Delay_threshold'] else 'On-time',
-        axis=1
-    )
+    df_deliveries['Actual_Delivery_Time'] = actual_time
+    df_deliveries['Status'] = pd.Categorical.from_codes(status_code,
+                                                        categories=['On-time', 'Delayed'])
 
     logger.info("End of the transformation.")
     
     cols = ['Delivery_ID', 'Pickup_DateTime', 'Weekday', 'Hour', 'Package_Type', 'Distance','Delivery_Zone',
                         'Weather_Condition', 'Actual_Delivery_Time', 'Status' ]
     
-    df_deliveries = df_deliveries[cols]
+    # copy() releases the memory held by the intermediate columns
+    df_deliveries = df_deliveries[cols].copy()
 
     return df_deliveries  # Return transformed DataFrame
 
@@ -341,8 +366,11 @@ def validation_dataframe(df, required_columns):
     if missing_columns:
         raise ValueError(f"Missing columns: {missing_columns}")
 
-    if df[required_columns].isnull().any().any():
-        raise ValueError("The dataframe contains null values")
+    # Check column by column and stop at the first one containing nulls,
+    # instead of materializing a full boolean frame with isnull().any().any()
+    null_column = next((col for col in required_columns if df[col].isna().any()), None)
+    if null_column:
+        raise ValueError(f"The dataframe contains null values in column {null_column}")
 
     logger.info("Validation of the dataframe completed.")
 
@@ -365,8 +393,16 @@ def save_results(df):
             logger.warning(f"Existing file detected {OUTPUT_PATH}, deletion in progress...")
             os.remove(OUTPUT_PATH)
         
-        # Save to CSV
-        df.to_csv(OUTPUT_PATH, index=False)
+        # Save to CSV with the multithreaded Arrow writer
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        # Second-resolution timestamps, avoids '.000000' suffixes in the output
+        schema = pa.schema([
+            pa.field(field.name, pa.timestamp('s')) if pa.types.is_timestamp(field.type)
+            else field
+            for field in table.schema
+        ])
+        pa_csv.write_csv(table.cast(schema), OUTPUT_PATH,
+                         write_options=pa_csv.WriteOptions(batch_size=8192))
         logger.info(f"Results saved to  {OUTPUT_PATH}")
         return True
     except Exception as e: